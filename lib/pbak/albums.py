@@ -6,16 +6,27 @@ assets by originalFileName, creates/updates albums, syncs metadata
 (picks → favorites, ratings), and stacks related files (TIF/DNG/ARW).
 """
 
+import http.client
 import json
 import os
 import re
+import select
 import sqlite3
 import sys
+import threading
 import time
-import urllib.request
 import urllib.error
+import urllib.request
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    import orjson  # optional — faster parsing of large asset search pages
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # ── UI helpers (match pbak bash style) ────────────────────────────────────
 
@@ -46,32 +57,130 @@ def debug(msg):
 
 # ── Immich API ────────────────────────────────────────────────────────────
 
+PAGE_SIZE = 1000
+ALBUM_CHUNK_SIZE = 500  # max asset IDs per album add/remove request
+MAX_WORKERS = 8  # concurrent API requests
+
+def _idle_socket_closed(sock) -> bool:
+    """An idle keep-alive socket that is readable has been closed by the server."""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
 class ImmichAPI:
     def __init__(self, server: str, api_key: str, dry_run: bool = False):
         self.server = server.rstrip("/")
         self.api_key = api_key
         self.dry_run = dry_run
+        self._pool = None  # created lazily by _map()
+
+        # One keep-alive connection per thread, reused across requests
+        url = urlsplit(self.server)
+        self._conn_cls = (http.client.HTTPSConnection if url.scheme == "https"
+                          else http.client.HTTPConnection)
+        self._host = url.netloc
+        self._base_path = url.path
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        # http.client ignores HTTP(S)_PROXY / NO_PROXY, so proxied setups go
+        # through urlopen instead (no keep-alive, but the proxy is honoured)
+        self._use_urlopen = (bool(urllib.request.getproxies().get(url.scheme))
+                             and not urllib.request.proxy_bypass(url.hostname or ""))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._conn_cls(self._host, timeout=30)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _map(self, fn, items) -> list:
+        """Run fn over items on a shared worker pool, results in input order."""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        return list(self._pool.map(fn, items))
 
     def _request(self, method: str, endpoint: str, data=None, readonly=False):
         if method != "GET" and not readonly and self.dry_run:
             debug(f"[dry-run] {method} {endpoint}")
             return None
 
-        url = f"{self.server}{endpoint}"
         body = json.dumps(data).encode() if data else None
-        req = urllib.request.Request(url, data=body, method=method, headers={
+        headers = {
             "x-api-key": self.api_key,
             "Content-Type": "application/json",
             "Accept": "application/json",
-        })
+        }
 
+        if self._use_urlopen:
+            status, reason, resp_headers, payload = self._send_urlopen(
+                method, endpoint, body, headers)
+        else:
+            # Resending is only safe when a duplicate request changes nothing
+            retry_ok = method in ("GET", "PUT", "DELETE") or readonly
+            status, reason, resp_headers, payload = self._send_keepalive(
+                method, endpoint, body, headers, retry_ok)
+
+        if status >= 400:
+            body_text = payload.decode(errors="replace")[:300]
+            debug(f"API {method} {endpoint} returned {status}: {body_text}")
+            raise urllib.error.HTTPError(f"{self.server}{endpoint}", status,
+                                         reason, resp_headers, None)
+        return _json_loads(payload) if payload and status != 204 else None
+
+    def _send_keepalive(self, method: str, endpoint: str, body, headers: dict,
+                        retry_ok: bool) -> tuple:
+        for attempt in (1, 2):
+            conn = self._connection()
+            if conn.sock is not None and _idle_socket_closed(conn.sock):
+                debug("Keep-alive connection closed by server, reconnecting")
+                conn.close()
+            reused = conn.sock is not None
+            sent = False
+            try:
+                conn.request(method, f"{self._base_path}{endpoint}",
+                             body=body, headers=headers)
+                sent = True
+                resp = conn.getresponse()
+                payload = resp.read()  # drain fully so the connection can be reused
+                return resp.status, resp.reason, resp.headers, payload
+            except ConnectionError as e:
+                conn.close()
+                # A request that failed to send never reached the server, so any
+                # method may be resent; once sent, only if a duplicate is harmless
+                if reused and attempt == 1 and (not sent or retry_ok):
+                    debug(f"Reconnecting after {e!r}")
+                    continue
+                error(f"Connection failed: {e}")
+                raise
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                error(f"Connection failed: {e}")
+                raise
+
+    def _send_urlopen(self, method: str, endpoint: str, body, headers: dict) -> tuple:
+        req = urllib.request.Request(f"{self.server}{endpoint}", data=body,
+                                     method=method, headers=headers)
         try:
             with urllib.request.urlopen(req, timeout=30) as resp:
-                return json.loads(resp.read()) if resp.status != 204 else None
+                return resp.status, resp.reason, resp.headers, resp.read()
         except urllib.error.HTTPError as e:
-            body_text = e.read().decode()[:300] if e.fp else ""
-            debug(f"API {method} {endpoint} returned {e.code}: {body_text}")
-            raise
+            return e.code, e.reason, e.headers, e.read() if e.fp else b""
         except urllib.error.URLError as e:
             error(f"Connection failed: {e.reason}")
             raise
@@ -80,25 +189,61 @@ class ImmichAPI:
         resp = self._request("GET", "/api/users/me")
         return resp["id"]
 
-    def build_asset_index(self, owner_id: str = "") -> dict[str, list[dict]]:
-        """Fetch all assets, return {originalFileName: [asset_dicts]}.
+    def build_asset_index(self, owner_id: str = "") -> dict[str, list[tuple]]:
+        """Fetch all assets, return {originalFileName: [(asset_id, owner_id, is_favorite)]}.
         If owner_id is set, only include assets owned by that user."""
+        query = {"size": PAGE_SIZE}
+        if owner_id:
+            # Filter server-side so other users' assets aren't downloaded
+            query["ownerId"] = owner_id
+
+        def fetch_page(page: int) -> tuple[list[dict], bool]:
+            """Return (items, has_next_page)."""
+            resp = self._request("POST", "/api/search/metadata",
+                                 {**query, "page": page}, readonly=True)
+            assets = resp.get("assets", {})
+            items = assets.get("items", [])
+            debug(f"Fetched page {page}: {len(items)} assets")
+            if "nextPage" in assets:
+                return items, assets["nextPage"] is not None
+            return items, len(items) >= PAGE_SIZE
+
+        try:
+            first_page = fetch_page(1)
+        except urllib.error.HTTPError as e:
+            # Older servers reject the field; fall back to filtering here
+            if "ownerId" not in query or e.code != 400:
+                raise
+            debug("Server rejected ownerId filter, filtering assets locally")
+            del query["ownerId"]
+            first_page = fetch_page(1)
+
         index = defaultdict(list)
-        page = 1
         skipped = 0
+        pages = [first_page]
+        # Page count is unknown: fetch waves that double up to MAX_WORKERS
+        # until a page has no nextPage
+        next_page = 2
+        wave_size = 2
         while True:
-            resp = self._request("POST", "/api/search/metadata",
-                                 {"page": page, "size": 1000}, readonly=True)
-            items = resp.get("assets", {}).get("items", [])
-            debug(f"Fetched page {page}: {len(items)} assets")
-            for a in items:
-                if owner_id and a.get("ownerId") != owner_id:
-                    skipped += 1
-                    continue
-                index[a["originalFileName"]].append(a)
-            if len(items) < 1000:
+            # Merge in page order so index lists stay deterministic
+            done = False
+            for items, has_next in pages:
+                for a in items:
+                    # Still checked when filtered server-side, in case the filter was ignored
+                    if owner_id and a.get("ownerId") != owner_id:
+                        skipped += 1
+                        continue
+                    index[a["originalFileName"]].append(
+                        (a["id"], a.get("ownerId", ""), bool(a.get("isFavorite"))))
+                if not has_next:
+                    done = True
+                    break
+            if done:
                 break
-            page += 1
+            pages = self._map(fetch_page, range(next_page, next_page + wave_size))
+            next_page += wave_size
+            wave_size = min(wave_size * 2, MAX_WORKERS)
         total = sum(len(v) for v in index.values())
         debug(f"Asset index: {total} assets (skipped {skipped} from other users)")
         return dict(index)
@@ -112,6 +257,18 @@ class ImmichAPI:
     def album_get(self, album_id: str) -> dict:
         return self._request("GET", f"/api/albums/{album_id}")
 
+    def album_asset_ids(self, album_ids) -> dict[str, set[str]]:
+        """Fetch current asset IDs of several albums concurrently.
+        Albums that fail to load are left out of the result."""
+        def fetch(album_id: str):
+            try:
+                album = self.album_get(album_id)
+                return album_id, {a["id"] for a in album.get("assets", [])}
+            except Exception:
+                debug(f"Failed to fetch album {album_id}")
+                return album_id, None
+        return {aid: ids for aid, ids in self._map(fetch, album_ids) if ids is not None}
+
     def album_add_assets(self, album_id: str, ids: list[str]):
         return self._request("PUT", f"/api/albums/{album_id}/assets", {"ids": ids})
 
@@ -130,21 +287,58 @@ class ImmichAPI:
         return self._request("POST", "/api/stacks",
                              {"primaryAssetId": primary_id, "assetIds": all_ids})
 
+    def stack_delete(self, stack_id: str):
+        return self._request("DELETE", f"/api/stacks/{stack_id}")
+
     def stacks_list(self) -> list[dict]:
         return self._request("GET", "/api/stacks") or []
 
 
 # ── LrC Catalog Reader ───────────────────────────────────────────────────
 
+_SMART_COMBINE = re.compile(r'combine\s*=\s*"(\w+)"')
+_SMART_BLOCK = re.compile(r'\{([^{}]+)\}')
+# key → (string value pattern, numeric value pattern)
+_SMART_KEY_PATTERNS = {
+    key: (re.compile(rf'{key}\s*=\s*"([^"]*)"'),
+          re.compile(rf'{key}\s*=\s*(-?[\d.]+)'))
+    for key in ("criteria", "operation", "value", "value2", "value_units")
+}
+
 class LrCCatalog:
     def __init__(self, path: str):
         self.path = path
         self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
-        self.conn.row_factory = sqlite3.Row
+        # Read-only access: larger page cache, memory-mapped I/O, in-memory temp
+        # b-trees for sorts/joins. The catalog can't be given extra indexes
+        # (TEMP indexes are only allowed on TEMP tables), so rely on LrC's own.
+        self.conn.executescript("""
+            PRAGMA query_only = 1;
+            PRAGMA cache_size = -200000;
+            PRAGMA mmap_size = 268435456;
+            PRAGMA temp_store = MEMORY;
+        """)
+        self._rating_index = self._index_on("Adobe_images", "rating")
 
     def close(self):
         self.conn.close()
 
+    def _index_on(self, table: str, column: str) -> str | None:
+        """Name of a full (non-partial) index on table led by column, if any."""
+        for _, name, _, _, partial in self.conn.execute(f"PRAGMA index_list({table})"):
+            if partial:
+                continue
+            cols = sorted(self.conn.execute(f"PRAGMA index_info('{name}')"))
+            if cols and cols[0][2] == column:
+                return name
+        return None
+
+    def _query(self, sql: str, params=()) -> list:
+        if VERBOSE:
+            plan = self.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            debug("Query plan: " + "; ".join(r[-1] for r in plan))
+        return self.conn.execute(sql, params).fetchall()
+
     def list_collections(self) -> list[dict]:
         rows = self.conn.execute("""
             SELECT c.id_local AS id, c.name,
@@ -163,10 +357,13 @@ class LrCCatalog:
             AND c.name != 'quick collection'
             ORDER BY c.name
         """).fetchall()
-        return [dict(r) for r in rows]
+        return [{"id": cid, "name": name, "type": ctype, "parent_name": parent}
+                for cid, name, ctype, parent in rows]
 
-    def collection_files(self, collection_id: int) -> list[dict]:
-        rows = self.conn.execute("""
+    # File rows are (filename, pick, rating, fileformat) tuples
+
+    def collection_files(self, collection_id: int) -> list[tuple]:
+        return self._query("""
             SELECT f.originalFilename AS filename,
                    COALESCE(i.pick, 0) AS pick,
                    COALESCE(i.rating, 0) AS rating,
@@ -175,10 +372,26 @@ class LrCCatalog:
             JOIN Adobe_images i ON i.id_local = ci.image
             JOIN AgLibraryFile f ON f.id_local = i.rootFile
             WHERE ci.collection = ?
-        """, (collection_id,)).fetchall()
-        return [dict(r) for r in rows]
+        """, (collection_id,))
+
+    def all_regular_collection_files(self) -> dict[int, list[tuple]]:
+        """Files of every regular collection in one query, keyed by collection ID."""
+        rows = self._query("""
+            SELECT ci.collection AS collection,
+                   f.originalFilename AS filename,
+                   COALESCE(i.pick, 0) AS pick,
+                   COALESCE(i.rating, 0) AS rating,
+                   i.fileFormat AS fileformat
+            FROM AgLibraryCollectionImage ci
+            JOIN Adobe_images i ON i.id_local = ci.image
+            JOIN AgLibraryFile f ON f.id_local = i.rootFile
+        """)
+        by_collection = defaultdict(list)
+        for collection, *f in rows:
+            by_collection[collection].append(tuple(f))
+        return dict(by_collection)
 
-    def smart_collection_files(self, collection_id: int) -> list[dict]:
+    def smart_collection_files(self, collection_id: int) -> list[tuple]:
         row = self.conn.execute("""
             SELECT content FROM AgLibraryCollectionContent
             WHERE collection = ? AND content LIKE 's = %'
@@ -194,12 +407,19 @@ class LrCCatalog:
             debug(f"Could not parse rules for collection {collection_id}")
             return []
 
+        # Rule values are bound as parameters, so the SQL text only depends on
+        # the rule shapes and repeats hit sqlite3's prepared-statement cache
         where_clauses = []
+        params = []
         needs_exif = False
+        has_rating = False
         for r in rules:
-            clause = self._rule_to_sql(r)
-            if clause:
+            sql_rule = self._rule_to_sql(r)
+            if sql_rule:
+                clause, clause_params = sql_rule
                 where_clauses.append(clause)
+                params.extend(clause_params)
+                has_rating = has_rating or r["criteria"] == "rating"
             if r["criteria"] == "focalLength":
                 needs_exif = True
 
@@ -210,19 +430,31 @@ class LrCCatalog:
         where = joiner.join(f"({c})" for c in where_clauses)
         joins = "LEFT JOIN AgHarvestedExifMetadata exif ON exif.image = i.id_local" if needs_exif else ""
 
-        rows = self.conn.execute(f"""
+        # Every row must satisfy an intersected rating rule, so let the rating
+        # index drive the scan rather than trusting the planner's choice
+        hint = ""
+        if combine == "intersect" and has_rating and self._rating_index:
+            hint = f"INDEXED BY {self._rating_index}"
+
+        sql = f"""
             SELECT f.originalFilename AS filename,
                    COALESCE(i.pick, 0) AS pick,
                    COALESCE(i.rating, 0) AS rating,
                    i.fileFormat AS fileformat
-            FROM Adobe_images i
-            JOIN AgLibraryFile f ON f.id_local = i.rootFile
+            FROM Adobe_images i {hint}
+            INNER JOIN AgLibraryFile f ON f.id_local = i.rootFile
             {joins}
             WHERE {where}
-        """).fetchall()
-        return [dict(r) for r in rows]
-
-    def resolve_collection(self, coll_id: int, coll_type: str) -> list[dict]:
+        """
+        try:
+            return self._query(sql, params)
+        except sqlite3.OperationalError as e:
+            if not hint:
+                raise
+            debug(f"Index hint rejected ({e}), retrying without it")
+            return self._query(sql.replace(hint, ""), params)
+
+    def resolve_collection(self, coll_id: int, coll_type: str) -> list[tuple]:
         if coll_type == "regular":
             return self.collection_files(coll_id)
         elif coll_type == "smart":
@@ -236,30 +468,29 @@ class LrCCatalog:
         rules = []
         combine = "intersect"
 
-        combine_m = re.search(r'combine\s*=\s*"(\w+)"', content)
+        combine_m = _SMART_COMBINE.search(content)
         if combine_m:
             combine = combine_m.group(1)
 
         # Match each { ... } block
-        for block in re.finditer(r'\{([^{}]+)\}', content):
+        for block in _SMART_BLOCK.finditer(content):
             text = block.group(1)
             rule = {}
-            for key in ("criteria", "operation", "value", "value2", "value_units"):
+            for key, (pat_str, pat_num) in _SMART_KEY_PATTERNS.items():
                 # Try string value first, then numeric
-                m = re.search(rf'{key}\s*=\s*"([^"]*)"', text)
+                m = pat_str.search(text) or pat_num.search(text)
                 if m:
                     rule[key] = m.group(1)
-                else:
-                    m = re.search(rf'{key}\s*=\s*(-?[\d.]+)', text)
-                    if m:
-                        rule[key] = m.group(1)
             if "criteria" in rule:
                 rules.append(rule)
 
         return rules, combine
 
     @staticmethod
-    def _rule_to_sql(rule: dict) -> str | None:
+    def _rule_to_sql(rule: dict) -> tuple[str, list] | None:
+        """Translate one rule to a (where clause, params) pair.
+        Numeric values are bound as numbers — pick/rating columns have no type
+        affinity, so a text '1' would never equal a stored 1.0."""
         criteria = rule.get("criteria", "")
         op = rule.get("operation", "")
         val = rule.get("value", "")
@@ -267,45 +498,45 @@ class LrCCatalog:
         units = rule.get("value_units", "")
 
         if criteria == "captureTime":
-            if op == ">":    return f"i.captureTime > '{val}'"
-            if op == "<":    return f"i.captureTime < '{val}'"
-            if op == "==":   return f"i.captureTime >= '{val}' AND i.captureTime < date('{val}', '+1 day')"
-            if op == "inLast": return f"i.captureTime > datetime('now', '-{val} {units}')"
+            if op == ">":    return "i.captureTime > ?", [val]
+            if op == "<":    return "i.captureTime < ?", [val]
+            if op == "==":   return "i.captureTime >= ? AND i.captureTime < date(?, '+1 day')", [val, val]
+            if op == "inLast": return "i.captureTime > datetime('now', ?)", [f"-{val} {units}"]
 
         elif criteria == "pick":
-            return f"i.pick = {val}"
+            return "i.pick = ?", [float(val)]
 
         elif criteria == "rating":
-            if op == "==": return f"i.rating = {val}"
-            if op == ">=": return f"i.rating >= {val}"
+            if op == "==": return "i.rating = ?", [float(val)]
+            if op == ">=": return "i.rating >= ?", [float(val)]
 
         elif criteria == "fileFormat":
-            if op == "==": return f"i.fileFormat = '{val}'"
-            if op == "!=": return f"(i.fileFormat IS NULL OR i.fileFormat != '{val}')"
+            if op == "==": return "i.fileFormat = ?", [val]
+            if op == "!=": return "(i.fileFormat IS NULL OR i.fileFormat != ?)", [val]
 
         elif criteria == "keywords":
             lc_val = val.lower()
             if op == "any":
-                return (f"EXISTS (SELECT 1 FROM AgLibraryKeywordImage ki "
-                        f"JOIN AgLibraryKeyword k ON k.id_local = ki.tag "
-                        f"WHERE ki.image = i.id_local AND k.lc_name = '{lc_val}')")
+                return ("EXISTS (SELECT 1 FROM AgLibraryKeywordImage ki "
+                        "JOIN AgLibraryKeyword k ON k.id_local = ki.tag "
+                        "WHERE ki.image = i.id_local AND k.lc_name = ?)"), [lc_val]
             if op == "empty":
-                return "NOT EXISTS (SELECT 1 FROM AgLibraryKeywordImage ki WHERE ki.image = i.id_local)"
+                return "NOT EXISTS (SELECT 1 FROM AgLibraryKeywordImage ki WHERE ki.image = i.id_local)", []
 
         elif criteria == "focalLength":
-            if op == "<": return f"exif.focalLength < {val}"
-            if op == ">": return f"exif.focalLength > {val}"
+            if op == "<": return "exif.focalLength < ?", [float(val)]
+            if op == ">": return "exif.focalLength > ?", [float(val)]
 
         elif criteria == "labelColor":
             colors = {"1": "Red", "2": "Yellow", "3": "Green", "4": "Blue", "5": "Purple"}
             name = colors.get(val, val)
-            return f"i.colorLabels = '{name}'"
+            return "i.colorLabels = ?", [name]
 
         elif criteria == "touchTime":
             cocoa_now = int(time.time()) - 978307200
             multiplier = {"days": 86400, "months": 2592000}.get(units, 86400)
             threshold = cocoa_now - int(float(val)) * multiplier
-            return f"i.touchTime > {threshold}"
+            return "i.touchTime > ?", [threshold]
 
         else:
             debug(f"Unknown smart collection criteria: {criteria}")
@@ -327,7 +558,7 @@ FORMAT_PRIORITY = {
 }
 
 def normalize_stem(filename: str) -> str:
-    stem = Path(filename).stem
+    stem = filename.rpartition(".")[0] or filename
     stem = _DXO_SUFFIX.sub("", stem)
     stem = _VIRTUAL_COPY.sub("", stem)
     return stem.lower()
@@ -338,6 +569,11 @@ def format_priority(ext: str) -> int:
 
 # ── Main sync logic ──────────────────────────────────────────────────────
 
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 def run(server: str, api_key: str, catalog_path: str,
         dry_run: bool = False, collection_filter: str = "",
         sync_metadata: bool = True, do_stacks: bool = True,
@@ -379,25 +615,32 @@ def run(server: str, api_key: str, catalog_path: str,
     # Build promotion map: asset_id → best asset_id in same stem group
     # So albums always reference the highest-quality format (TIF > DNG > RAW > JPG)
     promote: dict[str, str] = {}
-    stem_best: dict[str, str] = {}  # stem → best asset_id
+    stem_best: dict[str, tuple[str, int]] = {}  # stem → (best asset_id, priority)
+    # stem → [(asset_id, ext, filename)], also used for stacking in Phase 5
+    stem_groups: dict[str, list[tuple[str, str, str]]] = defaultdict(list)
+    # Assets already favorited in Immich, so Phase 4 only sends new favorites
+    immich_favs: set[str] = set()
     for filename, assets in asset_index.items():
-        for a in assets:
-            fn = a["originalFileName"]
-            stem = normalize_stem(fn)
-            ext = fn.rsplit(".", 1)[-1] if "." in fn else ""
-            prio = format_priority(ext)
-            if stem not in stem_best:
-                stem_best[stem] = (a["id"], prio)
-            elif prio < stem_best[stem][1]:
-                stem_best[stem] = (a["id"], prio)
+        # Every asset under a key shares that originalFileName
+        stem = normalize_stem(filename)
+        _, dot, ext = filename.rpartition(".")
+        if not dot:
+            ext = ""
+        prio = format_priority(ext)
+        for aid, _owner, is_fav in assets:
+            if is_fav:
+                immich_favs.add(aid)
+            stem_groups[stem].append((aid, ext, filename))
+            best = stem_best.get(stem)
+            if best is None or prio < best[1]:
+                stem_best[stem] = (aid, prio)
 
     # Map every asset in a stem group to the best one
-    for filename, assets in asset_index.items():
-        for a in assets:
-            stem = normalize_stem(a["originalFileName"])
-            best_id, _ = stem_best.get(stem, (a["id"], 9))
-            if best_id != a["id"]:
-                promote[a["id"]] = best_id
+    for stem, group in stem_groups.items():
+        best_id = stem_best[stem][0]
+        for aid, _, _ in group:
+            if best_id != aid:
+                promote[aid] = best_id
 
     promoted_count = len(promote)
     if promoted_count > 0:
@@ -412,7 +655,34 @@ def run(server: str, api_key: str, catalog_path: str,
     # ── Phase 3: Album sync loop ─────────────────────────────────────
 
     synced = created = skipped = errors = 0
-    meta_records = []  # (asset_id, pick, rating)
+    # Metadata buckets, filled while matching: picked assets, and assets by rating 1-5
+    fav_set: set[str] = set()
+    rating_sets: list[set[str]] = [set() for _ in range(6)]
+
+    # Resolve all regular collections with one query; a single --collection
+    # is cheaper to look up on its own
+    regular_files = None
+    if not collection_filter:
+        try:
+            regular_files = catalog.all_regular_collection_files()
+        except Exception as e:
+            debug(f"Bulk collection query failed, resolving one by one: {e}")
+
+    # Current contents of every album we may touch, fetched once upfront and
+    # then kept up to date locally as assets are added/removed
+    album_contents: dict[str, set[str]] = {}
+    if not dry_run:
+        existing = {album_by_name[c["name"]] for c in collections
+                    if c["name"] in album_by_name
+                    and (not collection_filter or c["name"] == collection_filter)}
+        album_contents = api.album_asset_ids(sorted(existing))
+
+    # album_id → asset IDs still to add / remove
+    pending_adds: dict[str, set[str]] = defaultdict(set)
+    pending_removes: dict[str, set[str]] = defaultdict(set)
+    # Subset of pending_removes that are duplicate cleanups, which are only
+    # valid once the better sibling has actually been added
+    pending_demotions: dict[str, set[str]] = defaultdict(set)
 
     for coll in collections:
         coll_id = coll["id"]
@@ -430,7 +700,10 @@ def run(server: str, api_key: str, catalog_path: str,
         info(f"Syncing: {_B}{display_name}{_R}")
 
         try:
-            files = catalog.resolve_collection(coll_id, coll_type)
+            if coll_type == "regular" and regular_files is not None:
+                files = regular_files.get(coll_id, [])
+            else:
+                files = catalog.resolve_collection(coll_id, coll_type)
         except Exception as e:
             warn(f"  Failed to resolve collection: {e}")
             errors += 1
@@ -442,24 +715,29 @@ def run(server: str, api_key: str, catalog_path: str,
             continue
 
         matched_ids = []
+        matched_set = set()
         unmatched = 0
 
-        for f in files:
-            filename = f["filename"]
+        for filename, pick, rating, _fmt in files:
             assets = asset_index.get(filename, [])
             if not assets:
                 debug(f"No Immich asset for: {filename}")
                 unmatched += 1
                 continue
-            aid = assets[0]["id"]
+            aid = assets[0][0]
             # Promote to best format in stem group (TIF > DNG > RAW > JPG)
             aid = promote.get(aid, aid)
-            matched_ids.append(aid)
+            # Deduplicate — multiple LrC files may promote to the same best asset
+            if aid not in matched_set:
+                matched_set.add(aid)
+                matched_ids.append(aid)
             if sync_metadata:
-                meta_records.append((aid, f["pick"], f["rating"]))
-
-        # Deduplicate — multiple LrC files may promote to the same best asset
-        matched_ids = list(dict.fromkeys(matched_ids))
+                # pick/rating have no type affinity and may be stored as text
+                if float(pick) == 1.0:
+                    fav_set.add(aid)
+                r = int(float(rating or 0))
+                if 1 <= r <= 5:
+                    rating_sets[r].add(aid)
 
         if not matched_ids:
             dim(f"  No assets matched in Immich ({len(files)} files in LrC)")
@@ -480,6 +758,7 @@ def run(server: str, api_key: str, catalog_path: str,
                     resp = api.album_create(coll_name)
                     album_id = resp["id"]
                     album_by_name[coll_name] = album_id
+                    album_contents[album_id] = set()
                     success(f"  Created album: {coll_name}")
                     created += 1
                 except Exception:
@@ -487,82 +766,140 @@ def run(server: str, api_key: str, catalog_path: str,
                     errors += 1
                     continue
 
-        # Add assets
+        # Queue album changes — applied in chunks once all collections are resolved
         if album_id:
+            current_ids = album_contents.get(album_id)
             if dry_run:
                 info(f"  [dry-run] Would add {len(matched_ids)} assets to '{coll_name}'")
             else:
-                try:
-                    api.album_add_assets(album_id, matched_ids)
-                    success(f"  {len(matched_ids)} assets → '{coll_name}'")
-                except Exception as e:
-                    error(f"  Failed to add assets to '{coll_name}': {e}")
-                    errors += 1
+                new_ids = [aid for aid in matched_ids
+                           if current_ids is None or aid not in current_ids]
+                pending_adds[album_id].update(new_ids)
+                pending_removes[album_id].difference_update(new_ids)
+                pending_demotions[album_id].difference_update(new_ids)
+                if current_ids is not None:
+                    current_ids.update(new_ids)
+                if new_ids:
+                    dim(f"  {len(new_ids)} new asset(s) for '{coll_name}'")
+                else:
+                    dim(f"  Up to date ({len(matched_ids)} assets)")
 
             # Remove lower-quality duplicates (e.g., ARW when TIF is now in album)
-            if not dry_run:
-                try:
-                    album_data = api.album_get(album_id)
-                    current_ids = {a["id"] for a in album_data.get("assets", [])}
-                    matched_set = set(matched_ids)
-                    # Find assets in album that are lower-priority siblings of promoted ones
-                    demoted = []
-                    for cid in current_ids:
-                        if cid not in matched_set and cid in promote:
-                            # This asset was in the album but its best sibling is now there too
-                            if promote[cid] in current_ids:
-                                demoted.append(cid)
-                    if demoted:
-                        api.album_remove_assets(album_id, demoted)
-                        dim(f"  Cleaned up {len(demoted)} lower-quality duplicate(s)")
-                except Exception:
-                    debug(f"Failed to clean up duplicates in: {coll_name}")
+            if not dry_run and current_ids is not None:
+                # Find assets in album that are lower-priority siblings of promoted ones
+                demoted = []
+                for cid in current_ids:
+                    if cid not in matched_set and cid in promote:
+                        # This asset was in the album but its best sibling is now there too
+                        if promote[cid] in current_ids:
+                            demoted.append(cid)
+                if demoted:
+                    pending_removes[album_id].update(demoted)
+                    pending_demotions[album_id].update(demoted)
+                    pending_adds[album_id].difference_update(demoted)
+                    current_ids.difference_update(demoted)
+                    dim(f"  Cleaning up {len(demoted)} lower-quality duplicate(s)")
 
             # Prune
-            if do_prune and album_id and not dry_run:
-                try:
-                    album_data = api.album_get(album_id)
-                    current_ids = {a["id"] for a in album_data.get("assets", [])}
-                    matched_set = set(matched_ids)
-                    to_remove = list(current_ids - matched_set)
-                    if to_remove:
-                        api.album_remove_assets(album_id, to_remove)
-                        dim(f"  Pruned {len(to_remove)} asset(s)")
-                except Exception:
-                    debug(f"Failed to prune album: {coll_name}")
+            if do_prune and not dry_run and current_ids is not None:
+                to_remove = current_ids - matched_set
+                if to_remove:
+                    pending_removes[album_id].update(to_remove)
+                    pending_demotions[album_id].difference_update(to_remove)
+                    pending_adds[album_id].difference_update(to_remove)
+                    current_ids.difference_update(to_remove)
+                    dim(f"  Pruning {len(to_remove)} asset(s)")
 
         synced += 1
 
+    # Apply queued album changes
+    album_names = {aid: name for name, aid in album_by_name.items()}
+    if any(pending_adds.values()) or any(pending_removes.values()):
+        print()
+        info("Updating albums...")
+
+    unsent_adds: dict[str, set[str]] = {}  # album_id → IDs whose add failed
+    for album_id, ids in pending_adds.items():
+        if not ids:
+            continue
+        name = album_names[album_id]
+        sent = set()
+        try:
+            for chunk in _chunks(sorted(ids), ALBUM_CHUNK_SIZE):
+                api.album_add_assets(album_id, chunk)
+                sent.update(chunk)
+            success(f"  {len(ids)} assets → '{name}'")
+        except Exception as e:
+            error(f"  Failed to add assets to '{name}': {e}")
+            errors += 1
+            unsent_adds[album_id] = ids - sent
+
+    for album_id, ids in pending_removes.items():
+        unsent = unsent_adds.get(album_id)
+        if unsent:
+            # Keep lower-quality copies whose better sibling never made it in
+            ids = {cid for cid in ids
+                   if cid not in pending_demotions[album_id] or promote[cid] not in unsent}
+        if not ids:
+            continue
+        name = album_names[album_id]
+        try:
+            for chunk in _chunks(sorted(ids), ALBUM_CHUNK_SIZE):
+                api.album_remove_assets(album_id, chunk)
+            dim(f"  Removed {len(ids)} asset(s) from '{name}'")
+        except Exception:
+            debug(f"Failed to remove assets from: {name}")
+
     # ── Phase 4: Metadata sync ────────────────────────────────────────
 
-    if sync_metadata and meta_records:
+    if sync_metadata and (fav_set or any(rating_sets)):
         print()
         header("Metadata Sync")
 
+        # An asset reached through several files keeps its highest rating (as
+        # the old one-by-one updates did), so the rating requests stay disjoint
+        for rating_val in range(4, 0, -1):
+            rating_sets[rating_val] -= set().union(*rating_sets[rating_val + 1:])
+
+        # (success message, failure message, call, args) — sent concurrently
+        updates = []
+
         # Favorites (pick == 1 or 1.0)
-        fav_ids = list({r[0] for r in meta_records if float(r[1]) == 1.0})
+        fav_ids = list(fav_set - immich_favs)
         if fav_ids:
             if dry_run:
                 info(f"[dry-run] Would set {len(fav_ids)} asset(s) as favorite")
             else:
-                try:
-                    api.assets_set_favorite(fav_ids, True)
-                    success(f"Set {len(fav_ids)} asset(s) as favorite")
-                except Exception as e:
-                    error(f"Failed to set favorites: {e}")
+                updates.append((f"Set {len(fav_ids)} asset(s) as favorite",
+                                "Failed to set favorites",
+                                api.assets_set_favorite, (fav_ids, True)))
 
         # Ratings 1-5
         for rating_val in range(1, 6):
-            r_ids = list({r[0] for r in meta_records if int(float(r[2])) == rating_val})
+            r_ids = list(rating_sets[rating_val])
             if r_ids:
                 if dry_run:
                     info(f"[dry-run] Would set {len(r_ids)} asset(s) to rating {rating_val}")
                 else:
-                    try:
-                        api.assets_set_rating(r_ids, rating_val)
-                        success(f"Set {len(r_ids)} asset(s) to rating {rating_val}")
-                    except Exception as e:
-                        error(f"Failed to set rating {rating_val}: {e}")
+                    updates.append((f"Set {len(r_ids)} asset(s) to rating {rating_val}",
+                                    f"Failed to set rating {rating_val}",
+                                    api.assets_set_rating, (r_ids, rating_val)))
+
+        def apply_update(update):
+            _, _, call, args = update
+            try:
+                call(*args)
+            except Exception as e:
+                return e
+            return None
+
+        for (ok_msg, fail_msg, _, _), exc in zip(updates, api._map(apply_update, updates)):
+            if exc is None:
+                success(ok_msg)
+            else:
+                error(f"{fail_msg}: {exc}")
+        if not updates and not dry_run:
+            dim("Favorites and ratings already up to date.")
 
     # ── Phase 5: Stacking ────────────────────────────────────────────
 
@@ -572,20 +909,6 @@ def run(server: str, api_key: str, catalog_path: str,
 
         info("Analyzing file groups...")
 
-        # Get all assets flat
-        all_assets = []
-        for filename, assets in asset_index.items():
-            for a in assets:
-                all_assets.append(a)
-
-        # Group by normalized stem
-        stem_groups: dict[str, list[tuple[str, str, str]]] = defaultdict(list)
-        for a in all_assets:
-            fn = a["originalFileName"]
-            stem = normalize_stem(fn)
-            ext = fn.rsplit(".", 1)[-1] if "." in fn else ""
-            stem_groups[stem].append((a["id"], ext, fn))
-
         # Map asset ID → existing stack ID, and stack ID → all asset IDs
         asset_to_stack: dict[str, str] = {}
         stack_assets: dict[str, set[str]] = defaultdict(set)
@@ -604,6 +927,7 @@ def run(server: str, api_key: str, catalog_path: str,
         stacks_created = 0
         stacks_updated = 0
         stacks_skipped = 0
+        stack_jobs = []  # (stem, old stack IDs, primary ID, other IDs)
 
         for stem, group in sorted(stem_groups.items()):
             if len(group) < 2:
@@ -612,8 +936,14 @@ def run(server: str, api_key: str, catalog_path: str,
             all_ids_in_group = {aid for aid, _, _ in group}
 
             # Check if all assets are already in the same stack
-            existing_stack_ids = {asset_to_stack[aid] for aid in all_ids_in_group if aid in asset_to_stack}
-            unstacked = [aid for aid in all_ids_in_group if aid not in asset_to_stack]
+            existing_stack_ids = set()
+            unstacked = []
+            for aid in all_ids_in_group:
+                sid = asset_to_stack.get(aid)
+                if sid:
+                    existing_stack_ids.add(sid)
+                else:
+                    unstacked.append(aid)
 
             if len(existing_stack_ids) == 1 and not unstacked:
                 # All already in same stack — nothing to do
@@ -628,23 +958,32 @@ def run(server: str, api_key: str, catalog_path: str,
                 dim(f"  [dry-run] Would stack: {stem} ({len(group)} files)")
                 stacks_created += 1
             else:
-                # If there's an existing stack, delete it first — we'll recreate with all files
-                for old_sid in existing_stack_ids:
-                    try:
-                        api._request("DELETE", f"/api/stacks/{old_sid}")
-                        debug(f"Deleted old stack {old_sid} for re-merge")
-                    except Exception:
-                        pass
+                stack_jobs.append((stem, existing_stack_ids, primary_id,
+                                   [aid for aid in all_ids if aid != primary_id]))
 
+        def restack(job) -> bool:
+            stem, old_sids, primary_id, other_ids = job
+            # If there's an existing stack, delete it first — we'll recreate with all files
+            for old_sid in old_sids:
                 try:
-                    api.stack_create(primary_id, [aid for aid in all_ids if aid != primary_id])
-                    if existing_stack_ids:
-                        stacks_updated += 1
-                    else:
-                        stacks_created += 1
+                    api.stack_delete(old_sid)
+                    debug(f"Deleted old stack {old_sid} for re-merge")
                 except Exception:
-                    debug(f"Failed to stack: {stem}")
-                    stacks_skipped += 1
+                    pass
+            try:
+                api.stack_create(primary_id, other_ids)
+                return True
+            except Exception:
+                debug(f"Failed to stack: {stem}")
+                return False
+
+        for job, ok in zip(stack_jobs, api._map(restack, stack_jobs)):
+            if not ok:
+                stacks_skipped += 1
+            elif job[1]:
+                stacks_updated += 1
+            else:
+                stacks_created += 1
 
         if stacks_created > 0:
             success(f"Created {stacks_created} stack(s)")
@@ -657,6 +996,7 @@ def run(server: str, api_key: str, catalog_path: str,
 
     # ── Summary ───────────────────────────────────────────────────────
 
+    api.close()
     catalog.close()
 
     print()